@@ -1,23 +1,40 @@
 import csv
+import io
 import logging
-from collections.abc import Iterable, Iterator
+import threading
+from collections.abc import Iterable, Iterator, Mapping
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from datetime import date, datetime, time
+from datetime import UTC, date, datetime
+from itertools import chain
 from pathlib import Path
-from time import sleep
-from typing import Any, Literal, TypedDict, cast
+from time import monotonic, sleep
+from typing import Any, BinaryIO, Literal, TypedDict, TypeVar, cast
 
 import click
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger("imdb-trakt-sync")
 
-_NOW: datetime = datetime.now()
-_END_OF_DAY_TIME: time = time(hour=23, minute=59, second=59)
+_T = TypeVar("_T")
+_TraktItemT = TypeVar("_TraktItemT", bound="TraktAnyItem")
 
-_IMDB_MOVIE_TYPES: set[str] = {"Movie", "Short", "TV Movie", "TV Special", "Video"}
-_IMDB_SHOW_TYPES: set[str] = {"TV Series", "TV Mini Series"}
-_IMDB_TYPES: set[str] = _IMDB_MOVIE_TYPES | _IMDB_SHOW_TYPES
+_IMDB_MOVIE_TYPES: frozenset[str] = frozenset(
+    {"Movie", "Short", "TV Movie", "TV Special", "Video"}
+)
+_IMDB_SHOW_TYPES: frozenset[str] = frozenset({"TV Series", "TV Mini Series"})
+_IMDB_TYPES: frozenset[str] = _IMDB_MOVIE_TYPES | _IMDB_SHOW_TYPES
+_IMDB_TRAKT_TYPES: Mapping[str, Literal["movie", "show", "episode"]] = {
+    **dict.fromkeys(_IMDB_MOVIE_TYPES, "movie"),
+    **dict.fromkeys(_IMDB_SHOW_TYPES, "show"),
+}
+
+_TRAKT_BATCH_SIZE: int = 500
+
+_executor = ThreadPoolExecutor(max_workers=2)
 
 
 @click.group()
@@ -57,46 +74,40 @@ def main(
 )
 @click.pass_obj
 def sync_watchlist(session: requests.Session, imdb_watchlist_url: str) -> None:
-    items = fetch_imdb_watchlist(imdb_watchlist_url)
+    watching_future = _executor.submit(trakt_watching_imdb_id, session)
 
-    existing_media_items = list(trakt_watchlist(session))
-    existing_movie_imdb_ids: set[str] = _compact_set(
-        _trakt_mediaitem_imdb_id(item)
-        for item in existing_media_items
-        if item["type"] == "movie"
-    )
-    existing_show_imdb_ids: set[str] = _compact_set(
-        _trakt_mediaitem_imdb_id(item)
-        for item in existing_media_items
-        if item["type"] == "show"
-    )
-
-    imdb_movie_ids: set[str] = {
-        item.imdb_id for item in items if item.trakt_type == "movie"
-    }
-    imdb_show_ids: set[str] = {
-        item.imdb_id for item in items if item.trakt_type == "show"
-    }
-
-    add_movies: list[TraktAnyItem] = [
-        {"ids": {"imdb": imdb}} for imdb in imdb_movie_ids - existing_movie_imdb_ids
-    ]
-    add_shows: list[TraktAnyItem] = [
-        {"ids": {"imdb": imdb}} for imdb in imdb_show_ids - existing_show_imdb_ids
-    ]
-    remove_movies: list[TraktAnyItem] = [
-        {"ids": {"imdb": imdb}} for imdb in existing_movie_imdb_ids - imdb_movie_ids
-    ]
-    remove_shows: list[TraktAnyItem] = [
-        {"ids": {"imdb": imdb}} for imdb in existing_show_imdb_ids - imdb_show_ids
-    ]
+    existing_movie_imdb_ids: set[str] = set()
+    existing_show_imdb_ids: set[str] = set()
 
-    if watching_item := trakt_watching(session):
+    imdb_movie_ids: set[str] = set()
+    imdb_show_ids: set[str] = set()
+
+    for item in fetch_imdb_watchlist(imdb_watchlist_url):
+        if item.trakt_type == "movie":
+            imdb_movie_ids.add(item.imdb_id)
+        elif item.trakt_type == "show":
+            imdb_show_ids.add(item.imdb_id)
+
+    for trakt_item in trakt_watchlist(session):
+        media_type = trakt_item["type"]
+        if media_type == "movie":
+            if imdb_id := trakt_item["movie"]["ids"].get("imdb"):
+                existing_movie_imdb_ids.add(imdb_id)
+        elif media_type == "show":
+            if imdb_id := trakt_item["show"]["ids"].get("imdb"):
+                existing_show_imdb_ids.add(imdb_id)
+
+    add_movies = _trakt_imdb_items(imdb_movie_ids - existing_movie_imdb_ids)
+    add_shows = _trakt_imdb_items(imdb_show_ids - existing_show_imdb_ids)
+    remove_movies = _trakt_imdb_items(existing_movie_imdb_ids - imdb_movie_ids)
+    remove_shows = _trakt_imdb_items(existing_show_imdb_ids - imdb_show_ids)
+
+    if watching_imdb_id := watching_future.result():
         logger.debug("Filtering out currently watching...")
-        add_movies = list(_block_watching_items(add_movies, watching_item))
-        add_shows = list(_block_watching_items(add_shows, watching_item))
-        remove_movies = list(_block_watching_items(remove_movies, watching_item))
-        remove_shows = list(_block_watching_items(remove_shows, watching_item))
+        add_movies = _block_watching_items(add_movies, watching_imdb_id)
+        add_shows = _block_watching_items(add_shows, watching_imdb_id)
+        remove_movies = _block_watching_items(remove_movies, watching_imdb_id)
+        remove_shows = _block_watching_items(remove_shows, watching_imdb_id)
 
     trakt_update_watchlist(session, movies=add_movies, shows=add_shows)
     trakt_remove_from_watchlist(session, movies=remove_movies, shows=remove_shows)
@@ -108,71 +119,90 @@ def sync_watchlist(session: requests.Session, imdb_watchlist_url: str) -> None:
     required=True,
     envvar="IMDB_RATINGS_URL",
 )
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=_TRAKT_BATCH_SIZE,
+    show_default=True,
+    help="Maximum number of ratings sent to Trakt per request",
+)
 @click.pass_obj
-def sync_ratings(session: requests.Session, imdb_ratings_url: str) -> None:
-    imdb_ratings = fetch_imdb_ratings(imdb_ratings_url)
+def sync_ratings(
+    session: requests.Session,
+    imdb_ratings_url: str,
+    batch_size: int,
+) -> None:
+    now = datetime.now()
+    today = now.date()
 
-    trakt_rated_at: dict[str, datetime] = {}
+    trakt_rated_at: dict[str, str] = {}
     trakt_rated: dict[str, int] = {}
-    imdb_rated: dict[str, int] = {}
+    imdb_rated: set[str] = set()
 
     add_movies: list[TraktRatedItem] = []
     add_shows: list[TraktRatedItem] = []
 
     for item in trakt_ratings(session, media_type="all"):
         if imdb_id := _trakt_mediaitem_imdb_id(item):
-            trakt_rated_at[imdb_id] = _fromisoformat(item["rated_at"])
+            trakt_rated_at[imdb_id] = item["rated_at"]
             trakt_rated[imdb_id] = item["rating"]
 
-    for imdb_rating in imdb_ratings:
-        imdb_rated[imdb_rating.imdb_id] = imdb_rating.rating
-
-        title_rated_at = datetime.combine(imdb_rating.rated_on, _END_OF_DAY_TIME)
-        title_rated_at = min(title_rated_at, _NOW)
+    for imdb_rating in fetch_imdb_ratings(imdb_ratings_url):
+        imdb_id = imdb_rating.imdb_id
+        rating = imdb_rating.rating
+        imdb_rated.add(imdb_id)
 
-        should_rate: bool = False
+        trakt_rating = trakt_rated.get(imdb_id)
+        if rating == trakt_rating:
+            continue
 
-        if imdb_rating.imdb_id in trakt_rated:
-            if imdb_rating.rating != trakt_rated[imdb_rating.imdb_id]:
-                logger.info(
-                    "Update rating https://www.imdb.com/title/%s/ %d -> %d @ %s",
-                    imdb_rating.imdb_id,
-                    trakt_rated[imdb_rating.imdb_id],
-                    imdb_rating.rating,
-                    title_rated_at,
-                )
-                should_rate = True
+        rated_on = imdb_rating.rated_on
+        if rated_on < today:
+            title_rated_at = f"{rated_on.isoformat()}T23:59:59"
+        else:
+            title_rated_at = now.isoformat()
 
+        if trakt_rating is not None:
+            logger.info(
+                "Update rating https://www.imdb.com/title/%s/ %d -> %d @ %s",
+                imdb_id,
+                trakt_rating,
+                rating,
+                title_rated_at,
+            )
         else:
             logger.info(
                 "Add rating https://www.imdb.com/title/%s/ %d @ %s",
-                imdb_rating.imdb_id,
-                imdb_rating.rating,
+                imdb_id,
+                rating,
                 title_rated_at,
             )
-            should_rate = True
-
-        if should_rate:
-            rated_item: TraktRatedItem = {
-                "rated_at": title_rated_at.isoformat(),
-                "rating": imdb_rating.rating,
-                "ids": {"imdb": imdb_rating.imdb_id},
-            }
-            if imdb_rating.trakt_type == "movie":
-                add_movies.append(rated_item)
-            elif imdb_rating.trakt_type == "show":
-                add_shows.append(rated_item)
-
-    not_rated_on_imdb = set(trakt_rated.keys()) - set(imdb_rated.keys())
+
+        rated_item: TraktRatedItem = {
+            "rated_at": title_rated_at,
+            "rating": rating,
+            "ids": {"imdb": imdb_id},
+        }
+        if imdb_rating.trakt_type == "movie":
+            add_movies.append(rated_item)
+        elif imdb_rating.trakt_type == "show":
+            add_shows.append(rated_item)
+
+    not_rated_on_imdb = trakt_rated.keys() - imdb_rated
     for imdb_id in not_rated_on_imdb:
         logger.info(
             "https://www.imdb.com/title/%s/ rated %d @ %s on Trakt, but not IMDb",
             imdb_id,
             trakt_rated[imdb_id],
-            trakt_rated_at[imdb_id],
+            datetime.fromisoformat(trakt_rated_at[imdb_id]),
         )
 
-    trakt_add_ratings(session=session, movies=add_movies, shows=add_shows)
+    trakt_add_ratings(
+        session=session,
+        movies=add_movies,
+        shows=add_shows,
+        batch_size=batch_size,
+    )
 
 
 @main.command()
@@ -183,6 +213,8 @@ def sync_ratings(session: requests.Session, imdb_ratings_url: str) -> None:
 )
 @click.pass_obj
 def sync_history(session: requests.Session, imdb_ratings_url: str) -> None:
+    watching_future = _executor.submit(trakt_watching_imdb_id, session)
+
     existing_movie_imdb_ids: set[str] = set()
     existing_episodes_imdb_ids: set[str] = set()
 
@@ -191,16 +223,18 @@ def sync_history(session: requests.Session, imdb_ratings_url: str) -> None:
     imdb_episode_ids: set[str] = set()
 
     for imdb_item in fetch_imdb_ratings(imdb_ratings_url):
-        imdb_id_rated_at[imdb_item.imdb_id] = imdb_item.rated_on
+        imdb_id = imdb_item.imdb_id
+        imdb_id_rated_at[imdb_id] = imdb_item.rated_on
         if imdb_item.trakt_type == "movie":
-            imdb_movie_ids.add(imdb_item.imdb_id)
+            imdb_movie_ids.add(imdb_id)
         elif imdb_item.trakt_type == "episode":
-            imdb_episode_ids.add(imdb_item.imdb_id)
+            imdb_episode_ids.add(imdb_id)
 
     for trakt_item in trakt_history(session):
-        if trakt_item["type"] == "movie":
+        media_type = trakt_item["type"]
+        if media_type == "movie":
             existing_movie_imdb_ids.add(trakt_item["movie"]["ids"]["imdb"])
-        elif trakt_item["type"] == "episode":
+        elif media_type == "episode":
             existing_episodes_imdb_ids.add(trakt_item["episode"]["ids"]["imdb"])
 
     add_movies: list[TraktWatchedItem] = [
@@ -212,27 +246,21 @@ def sync_history(session: requests.Session, imdb_ratings_url: str) -> None:
         for imdb in imdb_episode_ids - existing_episodes_imdb_ids
     ]
 
-    if watching_item := trakt_watching(session):
+    if watching_imdb_id := watching_future.result():
         logger.debug("Filtering out currently watching...")
-        add_movies = cast(
-            list[TraktWatchedItem],
-            list(_block_watching_items(add_movies, watching_item)),
-        )
-        add_episodes = cast(
-            list[TraktWatchedItem],
-            list(_block_watching_items(add_episodes, watching_item)),
-        )
+        add_movies = _block_watching_items(add_movies, watching_imdb_id)
+        add_episodes = _block_watching_items(add_episodes, watching_imdb_id)
 
     trakt_add_history(session, movies=add_movies, episodes=add_episodes)
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class IMDBWatchlistItem:
     imdb_id: str
     trakt_type: Literal["movie", "show", "episode"]
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class IMDBRatingItem:
     imdb_id: str
     rating: int
@@ -240,63 +268,80 @@ class IMDBRatingItem:
     trakt_type: Literal["movie", "show", "episode"]
 
 
-def fetch_imdb_watchlist(url: str) -> list[IMDBWatchlistItem]:
-    items: list[IMDBWatchlistItem] = []
+def fetch_imdb_watchlist(url: str) -> Iterator[IMDBWatchlistItem]:
+    reader = csv.reader(_iterlines(url))
+    header = next(reader, None)
+    if header is None:
+        return
+    const_idx = header.index("Const")
+    title_type_idx = header.index("Title Type")
 
-    for row in csv.DictReader(_iterlines(url)):
-        imdb_id = row["Const"]
-        assert imdb_id.startswith("tt"), f"Invalid IMDb ID: {imdb_id}"
+    for row in reader:
+        if not row:
+            continue
 
-        trakt_type: Literal["movie", "show", "episode"] | None = None
-        if row["Title Type"] in _IMDB_MOVIE_TYPES:
-            trakt_type = "movie"
-        elif row["Title Type"] in _IMDB_SHOW_TYPES:
-            trakt_type = "show"
-        assert trakt_type, f"Unknown IMDB Title Type: {row['Title Type']}"
+        imdb_id = row[const_idx]
+        if not imdb_id.startswith("tt"):
+            raise ValueError(f"Invalid IMDb ID: {imdb_id}")
 
-        item = IMDBWatchlistItem(imdb_id=imdb_id, trakt_type=trakt_type)
-        items.append(item)
+        title_type = row[title_type_idx]
+        trakt_type = _IMDB_TRAKT_TYPES.get(title_type)
+        assert trakt_type, f"Unknown IMDB Title Type: {title_type}"
 
-    return items
+        yield IMDBWatchlistItem(imdb_id=imdb_id, trakt_type=trakt_type)
 
 
-def fetch_imdb_ratings(url: str) -> list[IMDBRatingItem]:
-    items: list[IMDBRatingItem] = []
+def fetch_imdb_ratings(url: str) -> Iterator[IMDBRatingItem]:
+    reader = csv.reader(_iterlines(url))
+    header = next(reader, None)
+    if header is None:
+        return
+    const_idx = header.index("Const")
+    title_type_idx = header.index("Title Type")
+    rating_idx = header.index("Your Rating")
+    date_rated_idx = header.index("Date Rated")
 
-    for row in csv.DictReader(_iterlines(url)):
-        imdb_id = row["Const"]
-        assert imdb_id.startswith("tt"), f"Invalid IMDb ID: {imdb_id}"
+    for row in reader:
+        if not row:
+            continue
+
+        imdb_id = row[const_idx]
+        if not imdb_id.startswith("tt"):
+            raise ValueError(f"Invalid IMDb ID: {imdb_id}")
 
-        rating = int(row["Your Rating"])
-        rated_on: date = datetime.strptime(row["Date Rated"], "%Y-%m-%d")
+        rating = int(row[rating_idx])
+        rated_on = date.fromisoformat(row[date_rated_idx])
 
-        trakt_type: Literal["movie", "show", "episode"] | None = None
-        if row["Title Type"] in _IMDB_MOVIE_TYPES:
-            trakt_type = "movie"
-        elif row["Title Type"] in _IMDB_SHOW_TYPES:
-            trakt_type = "show"
-        assert trakt_type, f"Unknown IMDB Title Type: {row['Title Type']}"
+        title_type = row[title_type_idx]
+        trakt_type = _IMDB_TRAKT_TYPES.get(title_type)
+        assert trakt_type, f"Unknown IMDB Title Type: {title_type}"
 
-        item = IMDBRatingItem(
+        yield IMDBRatingItem(
             imdb_id=imdb_id,
             rating=rating,
             rated_on=rated_on,
             trakt_type=trakt_type,
         )
-        items.append(item)
 
-    return items
+
+_imdb_session = requests.Session()
 
 
 def _iterlines(path: Path | str) -> Iterator[str]:
     if isinstance(path, str) and path.startswith("http"):
         logger.debug("Fetching remote '%s'", path)
-        response = requests.get(path)
-        response.raise_for_status()
-        yield from response.iter_lines(decode_unicode=True)
+        with _imdb_session.get(path, stream=True, timeout=30) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            response.raw.auto_close = False
+            yield from io.TextIOWrapper(
+                cast(BinaryIO, response.raw),
+                encoding="utf-8",
+                newline="",
+            )
     else:
         logger.debug("Reading local file '%s'", path)
-        with open(path) as f:
+        with open(path, encoding="utf-8", newline="", buffering=1 << 20) as f:
             yield from f
 
 
@@ -377,6 +422,28 @@ _TRAKT_RATINGS_URL = "https://api.trakt.tv/sync/ratings"
 _TRAKT_HISTORY_URL = "https://api.trakt.tv/sync/history"
 _TRAKT_ADD_RATINGS_URL = "https://api.trakt.tv/sync/ratings"
 _TRAKT_REMOVE_RATINGS_URL = "https://api.trakt.tv/sync/ratings/remove"
+_TRAKT_MAX_WORKERS = 4
+_TRAKT_WRITE_INTERVAL = 1.0
+
+
+class _TraktRetry(Retry):
+    # Trakt does not process rate limited requests, so those are safe to
+    # replay for any method, including non-idempotent POSTs.
+    def is_retry(
+        self, method: str, status_code: int, has_retry_after: bool = False
+    ) -> bool:
+        if status_code == 429:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+_TRAKT_RETRY = _TraktRetry(
+    total=5,
+    backoff_factor=1.0,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=["GET", "PUT", "DELETE"],
+    respect_retry_after_header=True,
+)
 
 
 def trakt_session(client_id: str, access_token: str) -> requests.Session:
@@ -384,6 +451,7 @@ def trakt_session(client_id: str, access_token: str) -> requests.Session:
     session.headers.update(_TRAKT_API_HEADERS)
     session.headers["trakt-api-key"] = client_id
     session.headers["Authorization"] = f"Bearer {access_token}"
+    session.mount("https://", HTTPAdapter(max_retries=_TRAKT_RETRY))
     return session
 
 
@@ -395,18 +463,46 @@ class TraktRatelimit(TypedDict):
     until: str
 
 
+class RateLimiter:
+    def __init__(self, min_interval: float = 0.0) -> None:
+        self.min_interval = min_interval
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = monotonic()
+            if now < self._resume_at:
+                logger.debug("Sleeping for %.2f sec", self._resume_at - now)
+                sleep(self._resume_at - now)
+                now = self._resume_at
+            self._resume_at = now + self.min_interval
+
+    def pause(self, seconds: float) -> None:
+        with self._lock:
+            self._resume_at = max(self._resume_at, monotonic() + seconds)
+
+
+_trakt_read_limiter = RateLimiter()
+_trakt_write_limiter = RateLimiter(min_interval=_TRAKT_WRITE_INTERVAL)
+
+
 def trakt_request(
     session: requests.Session,
     method: Literal["GET", "POST", "PUT", "DELETE"],
     url: str,
     **kwargs: Any,
 ) -> requests.Response:
+    limiter = _trakt_read_limiter if method == "GET" else _trakt_write_limiter
+    limiter.wait()
+
     response = session.request(method, url, **kwargs)
     response.raise_for_status()
 
-    if method != "GET":
-        logger.debug("Sleeping for 1 sec")
-        sleep(1)
+    ratelimit = _trakt_ratelimit(response)
+    if ratelimit and ratelimit["remaining"] <= 0:
+        until = datetime.fromisoformat(ratelimit["until"])
+        limiter.pause((until - datetime.now(UTC)).total_seconds())
 
     return response
 
@@ -417,10 +513,19 @@ def trakt_request_paginated(
     url: str,
     limit: int,
 ) -> Iterator[Any]:
-    page = 1
+    return chain.from_iterable(
+        _trakt_request_pages(session, method=method, url=url, limit=limit)
+    )
 
-    while True:
-        response = trakt_request(
+
+def _trakt_request_pages(
+    session: requests.Session,
+    method: Literal["GET"],
+    url: str,
+    limit: int,
+) -> Iterator[list[Any]]:
+    def fetch_page(page: int) -> requests.Response:
+        return trakt_request(
             session,
             method=method,
             url=url,
@@ -430,12 +535,52 @@ def trakt_request_paginated(
             },
         )
 
-        yield from response.json()
+    response = fetch_page(1)
+    yield orjson.loads(response.content)
 
-        pagination = _trakt_pagination(response)
-        if pagination.page >= pagination.page_count:
-            break
-        page += 1
+    pagination = _trakt_pagination(response)
+    if pagination.page >= pagination.page_count:
+        return
+
+    remaining_pages = range(pagination.page + 1, pagination.page_count + 1)
+    max_workers = min(_TRAKT_MAX_WORKERS, len(remaining_pages))
+    if ratelimit := _trakt_ratelimit(response):
+        max_workers = max(1, min(max_workers, ratelimit["remaining"]))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for response in executor.map(fetch_page, remaining_pages):
+            yield orjson.loads(response.content)
+
+
+def trakt_request_batched(
+    session: requests.Session,
+    url: str,
+    data: dict[str, list[_T]],
+    batch_size: int = _TRAKT_BATCH_SIZE,
+) -> dict[str, dict[str, Any]]:
+    merged: dict[str, dict[str, Any]] = {}
+
+    for batch in _trakt_batches(data, batch_size):
+        response = trakt_request(
+            session,
+            method="POST",
+            url=url,
+            data=orjson.dumps(batch),
+        )
+        result: dict[str, Any] = orjson.loads(response.content)
+
+        for key in ["added", "existing", "deleted"]:
+            if counts := result.get(key):
+                merged_counts = merged.setdefault(key, {})
+                for media_type, count in counts.items():
+                    merged_counts[media_type] = merged_counts.get(media_type, 0) + count
+
+        if not_found := result.get("not_found"):
+            merged_not_found = merged.setdefault("not_found", {})
+            for media_type, items in not_found.items():
+                merged_not_found.setdefault(media_type, []).extend(items)
+
+    return merged
 
 
 @dataclass
@@ -455,8 +600,15 @@ def _trakt_pagination(response: requests.Response) -> TraktPagination:
     )
 
 
+def _trakt_ratelimit(response: requests.Response) -> TraktRatelimit | None:
+    if header := response.headers.get("X-Ratelimit"):
+        ratelimit: TraktRatelimit = orjson.loads(header)
+        return ratelimit
+    return None
+
+
 def trakt_watchlist(session: requests.Session) -> Iterator[TraktWatchlistItem]:
-    yield from trakt_request_paginated(
+    return trakt_request_paginated(
         session,
         method="GET",
         url=_TRAKT_WATCHLIST_URL,
@@ -466,30 +618,35 @@ def trakt_watchlist(session: requests.Session) -> Iterator[TraktWatchlistItem]:
 
 def trakt_update_watchlist(
     session: requests.Session,
-    movies: list[TraktAnyItem] = [],
-    shows: list[TraktAnyItem] = [],
-    seasons: list[TraktAnyItem] = [],
-    episodes: list[TraktAnyItem] = [],
+    *,
+    movies: list[TraktAnyItem] | None = None,
+    shows: list[TraktAnyItem] | None = None,
+    seasons: list[TraktAnyItem] | None = None,
+    episodes: list[TraktAnyItem] | None = None,
+    batch_size: int = _TRAKT_BATCH_SIZE,
 ) -> None:
-    if not movies and not shows and not seasons and not episodes:
+    data = {
+        media_type: items
+        for media_type, items in [
+            ("movies", movies),
+            ("shows", shows),
+            ("seasons", seasons),
+            ("episodes", episodes),
+        ]
+        if items
+    }
+    if not data:
         logger.debug("No items to update")
         return
 
-    data = {
-        "movies": movies,
-        "shows": shows,
-        "seasons": seasons,
-        "episodes": episodes,
-    }
-    response = trakt_request(
+    result = trakt_request_batched(
         session,
-        method="POST",
         url=_TRAKT_UPDATE_WATCHLIST_URL,
-        json=data,
+        data=data,
+        batch_size=batch_size,
     )
-    result = response.json()
 
-    for media_type in ["movies", "shows", "seasons", "episodes"]:
+    for media_type in data:
         added: int = result["added"][media_type]
         existing: int = result["existing"][media_type]
         not_found: list[TraktAnyItem] = result["not_found"][media_type]
@@ -507,29 +664,34 @@ def trakt_update_watchlist(
 
 def trakt_remove_from_watchlist(
     session: requests.Session,
-    movies: list[TraktAnyItem] = [],
-    shows: list[TraktAnyItem] = [],
-    seasons: list[TraktAnyItem] = [],
-    episodes: list[TraktAnyItem] = [],
+    *,
+    movies: list[TraktAnyItem] | None = None,
+    shows: list[TraktAnyItem] | None = None,
+    seasons: list[TraktAnyItem] | None = None,
+    episodes: list[TraktAnyItem] | None = None,
+    batch_size: int = _TRAKT_BATCH_SIZE,
 ) -> None:
-    if not movies and not shows and not seasons and not episodes:
+    data = {
+        media_type: items
+        for media_type, items in [
+            ("movies", movies),
+            ("shows", shows),
+            ("seasons", seasons),
+            ("episodes", episodes),
+        ]
+        if items
+    }
+    if not data:
         logger.debug("No items to remove")
         return
 
-    data = {
-        "movies": movies,
-        "shows": shows,
-        "seasons": seasons,
-        "episodes": episodes,
-    }
-    response = trakt_request(
+    result = trakt_request_batched(
         session,
-        method="POST",
         url=_TRAKT_REMOVE_FROM_WATCHLIST_URL,
-        json=data,
+        data=data,
+        batch_size=batch_size,
     )
-    result = response.json()
-    for media_type in ["movies", "shows", "seasons", "episodes"]:
+    for media_type in data:
         deleted: int = result["deleted"][media_type]
         not_found: list[TraktAnyItem] = result["not_found"][media_type]
         if deleted > 0:
@@ -549,7 +711,7 @@ def trakt_watching(session: requests.Session) -> TraktWatchingItem | None:
         url="https://api.trakt.tv/users/me/watching",
     )
     if response.status_code == 200:
-        data: TraktWatchingItem = response.json()
+        data: TraktWatchingItem = orjson.loads(response.content)
         return data
     elif response.status_code == 204:
         return None
@@ -568,37 +730,23 @@ def trakt_watching_imdb_id(session: requests.Session) -> str | None:
 
 
 def _block_watching_items(
-    items: Iterable[TraktAnyItem],
-    watching: TraktWatchingItem | None,
-) -> Iterator[TraktAnyItem]:
-    if watching is None:
-        yield from items
-        return
-
-    if watching["type"] == "movie":
-        watching_imdb_id = watching["movie"]["ids"]["imdb"]
-    elif watching["type"] == "episode":
-        watching_imdb_id = watching["episode"]["ids"]["imdb"]
-    else:
-        yield from items
-        return
-
-    for item in items:
-        if item["ids"].get("imdb") == watching_imdb_id:
-            logger.warning(
-                "https://www.imdb.com/title/%s/ is currently being watched, ignoring",
-                watching_imdb_id,
-            )
-            continue
-        else:
-            yield item
+    items: list[_TraktItemT],
+    watching_imdb_id: str,
+) -> list[_TraktItemT]:
+    unblocked = [item for item in items if item["ids"]["imdb"] != watching_imdb_id]
+    if len(unblocked) != len(items):
+        logger.warning(
+            "https://www.imdb.com/title/%s/ is currently being watched, ignoring",
+            watching_imdb_id,
+        )
+    return unblocked
 
 
 def trakt_ratings(
     session: requests.Session,
     media_type: Literal["movies", "shows", "seasons", "episodes", "all"] = "all",
 ) -> Iterator[TraktRatingItem]:
-    yield from trakt_request_paginated(
+    return trakt_request_paginated(
         session,
         method="GET",
         url=f"{_TRAKT_RATINGS_URL}/{media_type}",
@@ -608,30 +756,35 @@ def trakt_ratings(
 
 def trakt_add_ratings(
     session: requests.Session,
-    movies: list[TraktRatedItem] = [],
-    shows: list[TraktRatedItem] = [],
-    seasons: list[TraktRatedItem] = [],
-    episodes: list[TraktRatedItem] = [],
+    *,
+    movies: list[TraktRatedItem] | None = None,
+    shows: list[TraktRatedItem] | None = None,
+    seasons: list[TraktRatedItem] | None = None,
+    episodes: list[TraktRatedItem] | None = None,
+    batch_size: int = _TRAKT_BATCH_SIZE,
 ) -> None:
-    if not movies and not shows and not seasons and not episodes:
+    data = {
+        media_type: items
+        for media_type, items in [
+            ("movies", movies),
+            ("shows", shows),
+            ("seasons", seasons),
+            ("episodes", episodes),
+        ]
+        if items
+    }
+    if not data:
         logger.debug("No items to rate")
         return
 
-    data = {
-        "movies": movies,
-        "shows": shows,
-        "seasons": seasons,
-        "episodes": episodes,
-    }
-    response = trakt_request(
+    result = trakt_request_batched(
         session,
-        method="POST",
         url=_TRAKT_ADD_RATINGS_URL,
-        json=data,
+        data=data,
+        batch_size=batch_size,
     )
-    result = response.json()
 
-    for media_type in ["movies", "shows", "seasons", "episodes"]:
+    for media_type in data:
         added: int = result["added"][media_type]
         not_found: list[TraktAnyItem] = result["not_found"][media_type]
         if added > 0:
@@ -646,29 +799,34 @@ def trakt_add_ratings(
 
 def trakt_remove_ratings(
     session: requests.Session,
-    movies: list[TraktRatedItem] = [],
-    shows: list[TraktRatedItem] = [],
-    seasons: list[TraktRatedItem] = [],
-    episodes: list[TraktRatedItem] = [],
+    *,
+    movies: list[TraktRatedItem] | None = None,
+    shows: list[TraktRatedItem] | None = None,
+    seasons: list[TraktRatedItem] | None = None,
+    episodes: list[TraktRatedItem] | None = None,
+    batch_size: int = _TRAKT_BATCH_SIZE,
 ) -> None:
-    if not movies and not shows and not seasons and not episodes:
+    data = {
+        media_type: items
+        for media_type, items in [
+            ("movies", movies),
+            ("shows", shows),
+            ("seasons", seasons),
+            ("episodes", episodes),
+        ]
+        if items
+    }
+    if not data:
         logger.debug("No items to remove")
         return
 
-    data = {
-        "movies": movies,
-        "shows": shows,
-        "seasons": seasons,
-        "episodes": episodes,
-    }
-    response = trakt_request(
+    result = trakt_request_batched(
         session,
-        method="POST",
         url=_TRAKT_REMOVE_RATINGS_URL,
-        json=data,
+        data=data,
+        batch_size=batch_size,
     )
-    result = response.json()
-    for media_type in ["movies", "shows", "seasons", "episodes"]:
+    for media_type in data:
         deleted: int = result["deleted"][media_type]
         not_found: list[TraktAnyItem] = result["not_found"][media_type]
         if deleted > 0:
@@ -689,7 +847,7 @@ def trakt_history(
     if media_type:
         url += f"/{media_type}"
 
-    yield from trakt_request_paginated(
+    return trakt_request_paginated(
         session,
         method="GET",
         url=url,
@@ -699,28 +857,33 @@ def trakt_history(
 
 def trakt_add_history(
     session: requests.Session,
-    movies: list[TraktWatchedItem] = [],
-    shows: list[TraktWatchedItem] = [],
-    seasons: list[TraktWatchedItem] = [],
-    episodes: list[TraktWatchedItem] = [],
+    *,
+    movies: list[TraktWatchedItem] | None = None,
+    shows: list[TraktWatchedItem] | None = None,
+    seasons: list[TraktWatchedItem] | None = None,
+    episodes: list[TraktWatchedItem] | None = None,
+    batch_size: int = _TRAKT_BATCH_SIZE,
 ) -> None:
-    if not movies and not shows and not seasons and not episodes:
+    data = {
+        media_type: items
+        for media_type, items in [
+            ("movies", movies),
+            ("shows", shows),
+            ("seasons", seasons),
+            ("episodes", episodes),
+        ]
+        if items
+    }
+    if not data:
         logger.debug("No items to add")
         return
 
-    data = {
-        "movies": movies,
-        "shows": shows,
-        "seasons": seasons,
-        "episodes": episodes,
-    }
-    response = trakt_request(
+    result = trakt_request_batched(
         session,
-        method="POST",
         url=_TRAKT_HISTORY_URL,
-        json=data,
+        data=data,
+        batch_size=batch_size,
     )
-    result = response.json()
 
     for media_type in ["movies", "episodes"]:
         added: int = result["added"][media_type]
@@ -735,26 +898,36 @@ def trakt_add_history(
                 )
 
 
-def _trakt_mediaitem_imdb_id(item: TraktTypedContainer) -> str | None:
-    if item["type"] == "movie":
-        return item["movie"]["ids"]["imdb"]
-    elif item["type"] == "show":
-        return item["show"]["ids"]["imdb"]
-    elif item["type"] == "season":
-        return item["season"]["ids"]["imdb"]
-    elif item["type"] == "episode":
-        return item["episode"]["ids"]["imdb"]
-    else:
-        raise ValueError(f"Unknown media type: {item['type']}")
+def _trakt_batches(
+    data: dict[str, list[_T]],
+    batch_size: int,
+) -> Iterator[dict[str, list[_T]]]:
+    batch: dict[str, list[_T]] = {}
+    batch_len = 0
+
+    for media_type, items in data.items():
+        start = 0
+        while start < len(items):
+            chunk = items[start : start + batch_size - batch_len]
+            batch[media_type] = chunk
+            batch_len += len(chunk)
+            start += len(chunk)
 
+            if batch_len >= batch_size:
+                yield batch
+                batch = {}
+                batch_len = 0
 
-def _compact_set(s: Iterable[str | None]) -> set[str]:
-    return {x for x in s if x is not None}
+    if batch:
+        yield batch
 
 
-def _fromisoformat(s: str) -> datetime:
-    assert s.endswith("Z")
-    return datetime.fromisoformat(s[:-1])
+def _trakt_imdb_items(imdb_ids: Iterable[str]) -> list[TraktAnyItem]:
+    return [{"ids": {"imdb": imdb_id}} for imdb_id in imdb_ids]
+
+
+def _trakt_mediaitem_imdb_id(item: TraktTypedContainer) -> str | None:
+    return item[item["type"]]["ids"].get("imdb")
 
 
 if __name__ == "__main__":